@@ -5,17 +5,152 @@ Deploy on Railway
 
 v2.0: Added API key auth for external services (Clawdbot)
 """
-from fastapi import FastAPI, UploadFile, File, HTTPException, Header, Request
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from faster_whisper import WhisperModel
-import tempfile
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from starlette.datastructures import Headers
+from faster_whisper import BatchedInferencePipeline, WhisperModel
+from faster_whisper.transcribe import Segment, Word, restore_speech_timestamps
+from faster_whisper.vad import VadOptions, get_speech_timestamps
+import ctranslate2
+from av.audio.resampler import AudioResampler
+from blake3 import blake3
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Histogram, generate_latest, multiprocess
+)
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Protocol
+import numpy as np
+import anyio
+import asyncio
+import av
+import orjson
 import os
+import threading
+import time
 
 app = FastAPI(
     title="Momentum Transcription Service",
     description="Voice-to-text transcription using faster-whisper",
-    version="2.0.0"
+    version="2.0.0",
+    # orjson serializes the segment lists (lots of floats) much faster
+    default_response_class=ORJSONResponse,
+)
+
+# Per-stage timings, exported at /metrics. Buckets run from a few ms (VAD
+# on a short clip) up to a minute (model time on a long upload)
+MS_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+UPLOAD_MS = Histogram(
+    "transcribe_upload_ms", "Request arrival to handler start (body upload + multipart parse)",
+    buckets=MS_BUCKETS,
+)
+PYAV_DECODE_MS = Histogram(
+    "transcribe_pyav_decode_ms", "Decoding the upload to 16 kHz PCM", buckets=MS_BUCKETS
+)
+VAD_MS = Histogram("transcribe_vad_ms", "Silero VAD pre-pass", buckets=MS_BUCKETS)
+MODEL_MS = Histogram(
+    "transcribe_model_ms", "Backend time (language detection, encode, decode)",
+    buckets=MS_BUCKETS,
 )
+SERIALIZE_MS = Histogram(
+    "transcribe_serialize_ms", "Serializing the /transcribe response", buckets=MS_BUCKETS
+)
+
+
+def ms_since(t: float) -> float:
+    """Milliseconds elapsed since a time.perf_counter() reading."""
+    return (time.perf_counter() - t) * 1000
+
+
+def metrics_registry() -> CollectorRegistry:
+    """
+    Registry to serve at /metrics.
+    
+    With several uvicorn workers each process has its own histograms;
+    setting PROMETHEUS_MULTIPROC_DIR makes them write to shared files that
+    are aggregated here, so a scrape sees every worker, not just one.
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+
+METRICS_REGISTRY = metrics_registry()
+
+
+# A plain route rather than app.mount(), which would answer every scrape of
+# /metrics with a redirect to /metrics/
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus scrape endpoint"""
+    # Set as a header - media_type would append a second charset
+    return Response(generate_latest(METRICS_REGISTRY), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+# Upload size limit - checked against Content-Length, and counted while the
+# body is read for uploads without one
+MAX_UPLOAD_MB = int(os.environ.get("MAX_UPLOAD_MB", "25"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+
+
+class LimitUploadSize:
+    """
+    Reject uploads larger than MAX_UPLOAD_BYTES with a 413.
+    
+    Plain ASGI rather than @app.middleware("http"), so responses (the
+    NDJSON stream included) pass straight through. Content-Length is
+    checked before the body is read; uploads without one (chunked) are
+    counted as the body arrives and cut off at the limit instead of being
+    spooled in full.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        # Headers are in but the body isn't - the upload stage starts here
+        scope.setdefault("state", {})["received_at"] = time.perf_counter()
+        
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+            response = ORJSONResponse(
+                status_code=413,
+                content={"detail": f"Audio file too large (max {MAX_UPLOAD_MB}MB)"}
+            )
+            await response(scope, receive, send)
+            return
+        
+        received = 0
+        
+        async def receive_limited():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > MAX_UPLOAD_BYTES:
+                    # Raised while the form is parsed, so FastAPI turns it
+                    # into the 413 response
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Audio file too large (max {MAX_UPLOAD_MB}MB)"
+                    )
+            return message
+        
+        await self.app(scope, receive_limited, send)
+
+
+# Registered before CORS so CORS stays the outer layer and 413s still
+# carry CORS headers
+app.add_middleware(LimitUploadSize)
+
 
 # CORS - Allow Momentum domains
 app.add_middleware(
@@ -35,12 +170,660 @@ app.add_middleware(
 # API Key for external services (Clawdbot, etc.)
 # Set via TRANSCRIBE_API_KEY environment variable on Railway
 API_KEY = os.environ.get("TRANSCRIBE_API_KEY")
+_AUTH_ENABLED = bool(API_KEY)
+_BEARER = "Bearer "
+
+# Origin substrings accepted without an API key (browser requests from
+# Momentum); CORS itself is enforced by the middleware above
+_ALLOWED_ORIGIN_SUBSTR = ("localhost", "dailymomentum.io", "vercel.app")
 
-# Load model on startup (cached in memory)
-# Using 'base' (multilingual) instead of 'base.en' (English-only)
-print("🎤 Loading Whisper model (base - multilingual)...")
-model = WhisperModel("base", device="cpu", compute_type="int8")
-print("✅ Model loaded and ready!")
+# Uvicorn worker processes (each loads its own models)
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+# Concurrent transcriptions per worker. Decoding and inference run in a
+# thread pool so they never block the event loop (health checks, CORS
+# preflights)
+MAX_CONCURRENCY = int(os.environ.get("MAX_CONCURRENCY", "2"))
+EXECUTOR = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY)
+SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENCY)
+
+# CTranslate2 threading - pin explicitly so CT2 doesn't oversubscribe
+# the container's vCPUs. One CT2 worker per concurrent request, each with
+# its own share of the cores across all uvicorn workers
+CPU_THREADS = int(os.environ.get(
+    "CT2_CPU_THREADS",
+    max(1, (os.cpu_count() or 4) // (MAX_CONCURRENCY * WEB_CONCURRENCY))
+))
+NUM_WORKERS = int(os.environ.get("CT2_NUM_WORKERS", MAX_CONCURRENCY))
+
+
+# CPU features that decide which int8 kernels CTranslate2 can use
+SIMD_FLAGS = ("avx2", "avx512f", "avx512bw", "avx512_vnni", "avx_vnni", "amx_int8")
+
+
+def cpu_flags() -> set[str]:
+    """Read the CPU feature flags from /proc/cpuinfo (empty if unavailable)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+CPU_FLAGS = cpu_flags()
+
+
+def select_compute_type() -> str:
+    """
+    Pick the CTranslate2 compute type for this CPU.
+    
+    On CPU, "int8" already means int8 weights with float32 for the other
+    layers, and CTranslate2 picks the int8 kernels (VNNI or not) at
+    runtime from the detected ISA, so there is nothing to choose per CPU
+    here. This just logs what CT2 and the CPU support, and falls back to
+    float32 on builds without int8.
+    """
+    supported = ctranslate2.get_supported_compute_types("cpu")
+    detected = [flag for flag in SIMD_FLAGS if flag in CPU_FLAGS]
+    print(f"🧮 CTranslate2 {ctranslate2.__version__} CPU compute types: {sorted(supported)}")
+    print(f"🧮 CPU SIMD flags: {detected or 'none detected'}")
+    
+    return "int8" if "int8" in supported else "float32"
+
+
+# Models - 'base' is the default; short clips go to 'tiny', whose encoder
+# is ~3x cheaper with acceptable accuracy on short, clean voice notes
+# Using multilingual models instead of '.en' (English-only)
+DEFAULT_MODEL = "base"
+SHORT_CLIP_MODEL = "tiny"
+SHORT_CLIP_SECONDS = float(os.environ.get("SHORT_CLIP_SECONDS", "6.0"))
+
+
+def load_model(name: str, compute_type: str) -> WhisperModel:
+    """Load a Whisper model with the shared CTranslate2 settings."""
+    print(f"🎤 Loading Whisper model ({name} - multilingual, {compute_type}, "
+          f"{CPU_THREADS} threads x {NUM_WORKERS} workers)...")
+    return WhisperModel(
+        name,
+        device="cpu",
+        compute_type=compute_type,
+        cpu_threads=CPU_THREADS,
+        num_workers=NUM_WORKERS,
+    )
+
+
+# Clips longer than one 30s Whisper window are split into VAD chunks and
+# encoded BATCH_SIZE chunks at a time instead of window by window
+BATCHED_MIN_SECONDS = 30.0
+BATCH_SIZE = int(os.environ.get("BATCH_SIZE", "8"))
+
+# Inference backend: "ctranslate2" (faster-whisper, default) or "whispercpp"
+# (whisper.cpp via pywhispercpp with quantized ggml weights - roughly half
+# the RSS; install pywhispercpp separately). WHISPERCPP_MODEL is a
+# pywhispercpp model name or a path to any ggml file (e.g. a q4_0 build)
+BACKEND_NAME = os.environ.get("BACKEND", "ctranslate2").strip().lower()
+WHISPERCPP_MODEL = os.environ.get("WHISPERCPP_MODEL", "base-q5_1")
+
+# whisper.cpp runs one transcription at a time per worker, so each call
+# gets the worker's whole share of the cores
+WHISPERCPP_THREADS = int(os.environ.get(
+    "WHISPERCPP_THREADS",
+    max(1, (os.cpu_count() or 4) // WEB_CONCURRENCY)
+))
+
+# Default spoken language (e.g. "en"). Passing a language skips Whisper's
+# separate language-detection encoder pass. Unset = auto-detect.
+DEFAULT_LANGUAGE = os.environ.get("DEFAULT_LANGUAGE", "").strip().lower() or None
+
+# Whisper expects 16 kHz mono float32 PCM
+SAMPLE_RATE = 16000
+
+# Response cache for re-submitted clips, keyed by a BLAKE3 hash of the
+# decoded PCM plus the decode options (0 = disabled)
+CACHE_SIZE = int(os.environ.get("CACHE_SIZE", "512"))
+
+# Only touched from the event loop thread, so no lock is needed
+_cache: OrderedDict[tuple, dict] = OrderedDict()
+
+# Decoding - greedy (beam_size=1) is ~40% faster than beam search with a
+# small accuracy cost on short voice notes; callers can opt into a wider beam
+BEAM_SIZE = int(os.environ.get("WHISPER_BEAM_SIZE", "1"))
+MAX_BEAM_SIZE = 10
+
+# Silero VAD settings for the pre-pass that strips silence before Whisper
+VAD_OPTIONS = VadOptions(min_silence_duration_ms=500)
+
+
+class Transcription(NamedTuple):
+    """What a backend returns for one clip."""
+    segments: Iterable[Segment]  # May be lazy - work happens as consumed
+    language: str
+    model: str
+
+
+class Backend(Protocol):
+    """A Whisper implementation the endpoints can run on."""
+    
+    default_model: str
+    supported_languages: list[str]
+    # What the backend can honour per request - anything else is a 400
+    # rather than being silently ignored
+    beam_sizes: range
+    word_timestamps: bool
+    
+    def transcribe(
+        self,
+        speech: np.ndarray,
+        *,
+        speech_chunks: list[dict],
+        language: str | None,
+        beam_size: int,
+        word_timestamps: bool,
+    ) -> Transcription:
+        """
+        Transcribe 16 kHz mono PCM that has already been stripped of silence.
+        
+        speech_chunks are the VAD regions (in samples on the original audio)
+        that were concatenated into speech, for backends that split long
+        audio themselves.
+        """
+        ...
+    
+    def warmup(self) -> None:
+        """Run a dummy transcription so first-call setup happens before serving."""
+        ...
+    
+    def health(self) -> dict:
+        """Backend-specific /health fields ("config" and "notes" are merged in)."""
+        ...
+
+
+class CT2Backend:
+    """
+    faster-whisper on CTranslate2 (int8).
+    
+    Short clips go to 'tiny', everything else to 'base'; clips longer than
+    one Whisper window run through the batched pipeline.
+    """
+    
+    default_model = DEFAULT_MODEL
+    beam_sizes = range(1, MAX_BEAM_SIZE + 1)
+    word_timestamps = True
+    
+    def __init__(self):
+        self.compute_type = select_compute_type()
+        self.models = {
+            name: load_model(name, self.compute_type) for name in (SHORT_CLIP_MODEL, DEFAULT_MODEL)
+        }
+        self.supported_languages = self.models[DEFAULT_MODEL].supported_languages
+    
+    def transcribe(
+        self,
+        speech: np.ndarray,
+        *,
+        speech_chunks: list[dict],
+        language: str | None,
+        beam_size: int,
+        word_timestamps: bool,
+    ) -> Transcription:
+        # Pick the model by speech length
+        speech_s = len(speech) / SAMPLE_RATE
+        model_name = select_model(speech_s)
+        
+        # Decode options are spelled out so library default changes can't
+        # silently slow us down. Voice notes are independent utterances, so
+        # feeding previous text back into each window only adds decoder work;
+        # word timestamps need an extra alignment pass and are opt-in
+        options = dict(
+            language=language,
+            beam_size=beam_size,
+            best_of=1,
+            temperature=0,
+            condition_on_previous_text=False,
+            word_timestamps=word_timestamps,
+            suppress_blank=True,
+            without_timestamps=False,
+            initial_prompt=None,
+        )
+        
+        # Transcribe with faster-whisper (batched over chunks for long clips;
+        # the chunks come from trim_silence()'s VAD regions, so the pipeline
+        # doesn't run Silero a second time)
+        if speech_s >= BATCHED_MIN_SECONDS:
+            # A fresh pipeline per call - it keeps word-timestamp state on
+            # the instance, so concurrent clips can't share one. It only
+            # holds a reference to the model, so this is cheap
+            batched = BatchedInferencePipeline(model=self.models[DEFAULT_MODEL])
+            segments, info = batched.transcribe(
+                speech,
+                batch_size=BATCH_SIZE,
+                clip_timestamps=batch_clips(speech_chunks),
+                **options
+            )
+        else:
+            segments, info = self.models[model_name].transcribe(
+                speech,
+                vad_filter=False,  # Already filtered by trim_silence()
+                **options
+            )
+        return Transcription(segments, info.language, model_name)
+    
+    def warmup(self) -> None:
+        silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+        
+        def run(model: WhisperModel):
+            segments, _ = model.transcribe(silence, language="en", beam_size=1, vad_filter=False)
+            list(segments)
+        
+        # Each model has NUM_WORKERS CT2 workers with their own thread pool
+        # and scratch buffers; one call at a time would only warm one of
+        # them, so submit a call per worker concurrently
+        with ThreadPoolExecutor(max_workers=NUM_WORKERS * len(self.models)) as pool:
+            futures = [
+                pool.submit(run, model) for model in self.models.values() for _ in range(NUM_WORKERS)
+            ]
+            for future in futures:
+                future.result()
+    
+    def health(self) -> dict:
+        return {
+            "compute_type": self.compute_type,
+            "ctranslate2": ctranslate2.__version__,
+            "cpu_simd": [flag for flag in SIMD_FLAGS if flag in CPU_FLAGS],
+            "config": {
+                "CT2_CPU_THREADS": CPU_THREADS,
+                "CT2_NUM_WORKERS": NUM_WORKERS,
+                "SHORT_CLIP_SECONDS": SHORT_CLIP_SECONDS,
+                "BATCH_SIZE": BATCH_SIZE,
+            },
+            "notes": {
+                "beam_size": "1 = greedy (fastest). Pass beam_size (up to "
+                             f"{MAX_BEAM_SIZE}) per request for higher accuracy "
+                             "at ~40% slower decoding.",
+            },
+        }
+
+
+class WhisperCppBackend:
+    """
+    whisper.cpp via pywhispercpp, using quantized ggml weights.
+    
+    whisper.cpp keeps decode parameters on the model between calls, so
+    transcriptions are serialized with a lock. The sampling strategy is
+    fixed at load time from WHISPER_BEAM_SIZE - greedy when it is 1,
+    otherwise beam search with a per-request width of 2 or more. Word
+    timestamps are not supported, and segments arrive once the whole clip
+    is decoded.
+    """
+    
+    word_timestamps = False
+    
+    def __init__(self):
+        from pywhispercpp.model import Model
+        
+        print(f"🎤 Loading whisper.cpp model ({WHISPERCPP_MODEL}, {WHISPERCPP_THREADS} threads)...")
+        self.default_model = WHISPERCPP_MODEL
+        self.model = Model(
+            WHISPERCPP_MODEL,
+            params_sampling_strategy=0 if BEAM_SIZE == 1 else 1,
+            n_threads=WHISPERCPP_THREADS,
+            print_progress=False,
+            print_realtime=False,
+        )
+        self.supported_languages = Model.available_languages()
+        self.beam_sizes = range(1, 2) if BEAM_SIZE == 1 else range(2, MAX_BEAM_SIZE + 1)
+        self.lock = threading.Lock()
+    
+    def transcribe(
+        self,
+        speech: np.ndarray,
+        *,
+        speech_chunks: list[dict],
+        language: str | None,
+        beam_size: int,
+        word_timestamps: bool,
+    ) -> Transcription:
+        with self.lock:
+            if language is None:
+                (language, _), _ = self.model.auto_detect_language(speech, n_threads=WHISPERCPP_THREADS)
+            results = self.model.transcribe(
+                speech,
+                language=language,
+                beam_search={"beam_size": beam_size, "patience": -1.0},
+                no_context=True,
+                suppress_blank=True,
+            )
+        
+        # whisper.cpp times are in 10ms ticks; pywhispercpp strips the
+        # leading space Whisper puts on each segment, so restore it
+        segments = [
+            Segment(
+                id=i, seek=0, start=r.t0 / 100, end=r.t1 / 100, text=" " + r.text,
+                tokens=[], avg_logprob=0.0, compression_ratio=0.0,
+                no_speech_prob=0.0, words=None, temperature=0.0,
+            )
+            for i, r in enumerate(results, start=1)
+        ]
+        return Transcription(segments, language, WHISPERCPP_MODEL)
+    
+    def warmup(self) -> None:
+        with self.lock:
+            self.model.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32), language="en")
+    
+    def health(self) -> dict:
+        if BEAM_SIZE == 1:
+            beam_note = ("Greedy decoding, fixed at startup. Set WHISPER_BEAM_SIZE > 1 "
+                         "to load with beam search instead.")
+        else:
+            beam_note = (f"Beam search, fixed at startup. Pass beam_size (2 to "
+                         f"{MAX_BEAM_SIZE}) per request to change the width.")
+        return {
+            "config": {
+                "WHISPERCPP_MODEL": WHISPERCPP_MODEL,
+                "WHISPERCPP_THREADS": WHISPERCPP_THREADS,
+            },
+            "notes": {
+                "beam_size": beam_note,
+            },
+        }
+
+
+BACKENDS = {
+    "ctranslate2": CT2Backend,
+    "whispercpp": WhisperCppBackend,
+}
+if BACKEND_NAME not in BACKENDS:
+    raise RuntimeError(f"Unknown BACKEND {BACKEND_NAME!r}, expected one of {sorted(BACKENDS)}")
+
+# Load models on startup (cached in memory)
+BACKEND: Backend = BACKENDS[BACKEND_NAME]()
+print("✅ Models loaded and ready!")
+
+
+def decode_audio_file(file: BinaryIO) -> np.ndarray:
+    """
+    Decode an uploaded audio file to 16 kHz mono float32 PCM in memory.
+    
+    Uses PyAV (the same ffmpeg bindings faster-whisper uses) reading
+    straight from the upload's file object, so the upload is never copied
+    into a bytes object or written to a temp file of our own. The container
+    format is probed from the bytes themselves, so the declared content
+    type and file name don't matter.
+    """
+    resampler = AudioResampler(format="flt", layout="mono", rate=SAMPLE_RATE)
+    chunks = []
+    
+    try:
+        with av.open(file, mode="r") as container:
+            if not container.streams.audio:
+                raise HTTPException(status_code=400, detail="No audio stream found in file")
+            
+            for frame in container.decode(container.streams.audio[0]):
+                for resampled in resampler.resample(frame):
+                    chunks.append(resampled.to_ndarray().reshape(-1))
+            # Flush samples buffered inside the resampler
+            for resampled in resampler.resample(None):
+                chunks.append(resampled.to_ndarray().reshape(-1))
+    except av.error.InvalidDataError:
+        raise HTTPException(status_code=400, detail="Unsupported or corrupt audio file")
+    
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks).astype(np.float32, copy=False)
+
+
+def trim_silence(pcm: np.ndarray) -> tuple[np.ndarray, list[dict]]:
+    """
+    Run Silero VAD over the PCM and keep only the speech regions.
+    
+    Returns the concatenated speech audio and the speech chunks (in
+    samples) needed to map timestamps back to the original audio. Both
+    are empty when no speech was found.
+    """
+    speech_chunks = get_speech_timestamps(pcm, VAD_OPTIONS, sampling_rate=SAMPLE_RATE)
+    if not speech_chunks:
+        return np.zeros(0, dtype=np.float32), []
+    
+    speech = np.concatenate([pcm[c["start"]:c["end"]] for c in speech_chunks])
+    return speech, speech_chunks
+
+
+def batch_clips(speech_chunks: list[dict]) -> list[dict]:
+    """
+    Pack the VAD regions into clips for the batched pipeline.
+    
+    The regions sit back to back in the trimmed audio; consecutive ones
+    are grouped into clips of at most one Whisper window (30s), so cuts
+    fall on speech gaps. A single region longer than that is split into
+    30s pieces. Returns start/end in seconds on the trimmed audio.
+    """
+    window = int(BATCHED_MIN_SECONDS * SAMPLE_RATE)
+    clips = []
+    start = end = 0
+    
+    for chunk in speech_chunks:
+        length = chunk["end"] - chunk["start"]
+        if end > start and end + length - start > window:
+            clips.append((start, end))
+            start = end
+        end += length
+        while end - start > window:
+            clips.append((start, start + window))
+            start += window
+    if end > start:
+        clips.append((start, end))
+    
+    return [{"start": s / SAMPLE_RATE, "end": e / SAMPLE_RATE} for s, e in clips]
+
+
+def select_model(duration_s: float) -> str:
+    """Route short clips to the small model, everything else to the default."""
+    return SHORT_CLIP_MODEL if duration_s < SHORT_CLIP_SECONDS else DEFAULT_MODEL
+
+
+def resolve_language(requested: str | None) -> str | None:
+    """
+    Resolve the language to transcribe with.
+    
+    An explicit request value wins over DEFAULT_LANGUAGE; "auto" forces
+    language detection. Returns None when detection should run.
+    """
+    language = (requested or "").strip().lower() or DEFAULT_LANGUAGE
+    if language in (None, "auto"):
+        return None
+    
+    if language not in BACKEND.supported_languages:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported language: {language}"
+        )
+    return language
+
+
+def resolve_beam_size(requested: int | None) -> int:
+    """Use the requested beam size if given, else WHISPER_BEAM_SIZE."""
+    if requested is None:
+        return BEAM_SIZE
+    
+    allowed = BACKEND.beam_sizes
+    if requested not in allowed:
+        if len(allowed) == 1:
+            detail = f"beam_size must be {allowed[0]} on the {BACKEND_NAME} backend"
+        else:
+            detail = f"beam_size must be between {allowed[0]} and {allowed[-1]}"
+        raise HTTPException(status_code=400, detail=detail)
+    return requested
+
+
+def cache_get(key: tuple) -> dict | None:
+    """Look up a cached response, marking it most recently used."""
+    result = _cache.get(key)
+    if result is not None:
+        _cache.move_to_end(key)
+    return result
+
+
+def cache_put(key: tuple, result: dict) -> None:
+    """Store a response, evicting the least recently used past CACHE_SIZE."""
+    if CACHE_SIZE <= 0:
+        return
+    _cache[key] = result
+    _cache.move_to_end(key)
+    while len(_cache) > CACHE_SIZE:
+        _cache.popitem(last=False)
+
+
+def start_transcription(
+    pcm: np.ndarray, lang: str | None, beam: int, word_timestamps: bool = False
+) -> Transcription | None:
+    """
+    Run the VAD pre-pass and start the backend on the speech regions.
+    
+    Returns the backend's result with segment timestamps mapped back to
+    the original audio, or None when no speech was found.
+    """
+    # Strip silence up front - silent clips never touch the encoder
+    t = time.perf_counter()
+    speech, speech_chunks = trim_silence(pcm)
+    VAD_MS.observe(ms_since(t))
+    if not speech_chunks:
+        return None
+    
+    t = time.perf_counter()
+    result = BACKEND.transcribe(
+        speech,
+        speech_chunks=speech_chunks,
+        language=lang,
+        beam_size=beam,
+        word_timestamps=word_timestamps,
+    )
+    segments = timed_segments(result.segments, ms_since(t))
+    
+    # Map timestamps from the trimmed audio back to the upload
+    segments = restore_speech_timestamps(segments, speech_chunks, SAMPLE_RATE)
+    return result._replace(segments=segments)
+
+
+def timed_segments(segments: Iterable[Segment], elapsed_ms: float) -> Iterator[Segment]:
+    """
+    Pass segments through, recording the backend's time in MODEL_MS.
+    
+    Backends decode lazily as segments are consumed, so only the time
+    spent inside the iterator counts, on top of the eager setup
+    (language detection) already in elapsed_ms. Observed once the clip
+    is finished; abandoned streams are not recorded.
+    """
+    segments = iter(segments)
+    while True:
+        t = time.perf_counter()
+        segment = next(segments, None)
+        elapsed_ms += ms_since(t)
+        if segment is None:
+            break
+        yield segment
+    MODEL_MS.observe(elapsed_ms)
+
+
+def word_list(words: list[Word]) -> list[dict]:
+    """
+    Response shape of a segment's word timings.
+    
+    Word alignment returns numpy floats, which plain orjson.dumps (the
+    NDJSON stream) can't serialize, so times are cast to float.
+    """
+    return [
+        {"start": round(float(w.start), 2), "end": round(float(w.end), 2), "word": w.word.strip()}
+        for w in words
+    ]
+
+
+def segment_item(segment: Segment) -> dict:
+    """Response shape of one segment (both /transcribe and the stream)."""
+    item = {
+        "start": round(float(segment.start), 2),
+        "end": round(float(segment.end), 2),
+        "text": segment.text.strip()
+    }
+    if segment.words:
+        item["words"] = word_list(segment.words)
+    return item
+
+
+def no_speech(duration: float, language: str, model_name: str | None) -> dict:
+    """Response fields for a clip with nothing to transcribe."""
+    return {
+        "duration": duration,
+        "language": language,
+        "model": model_name,
+        "message": "No speech detected in audio"
+    }
+
+
+def transcribe_pcm(
+    pcm: np.ndarray, lang: str | None, beam: int, word_timestamps: bool = False
+) -> dict:
+    """Transcribe decoded 16 kHz PCM and build the /transcribe response."""
+    duration = round(len(pcm) / SAMPLE_RATE, 2)
+    
+    started = start_transcription(pcm, lang, beam, word_timestamps)
+    if started is None:
+        return {"text": "", "segments": [], **no_speech(duration, lang or "unknown", None)}
+    segments, language, model_name = started
+    
+    # Collect results in one pass
+    text_parts = []
+    segment_list = []
+    
+    for segment in segments:
+        text_parts.append(segment.text)
+        segment_list.append(segment_item(segment))
+    
+    # Whisper segments carry their own leading space, so plain
+    # concatenation gives correctly spaced text
+    full_text = "".join(text_parts).strip()
+    
+    # Handle empty transcription
+    if not full_text:
+        return {"text": "", "segments": [], **no_speech(duration, language, model_name)}
+    
+    return {
+        "text": full_text,
+        "segments": segment_list,
+        "duration": duration,
+        "language": language,
+        "model": model_name
+    }
+
+
+def transcribe_pcm_lines(
+    pcm: np.ndarray, lang: str | None, beam: int, word_timestamps: bool = False
+) -> Iterator[bytes]:
+    """
+    Transcribe decoded 16 kHz PCM as NDJSON lines for /transcribe/stream.
+    
+    Yields one line per segment as Whisper produces it, then a final
+    summary line.
+    """
+    duration = round(len(pcm) / SAMPLE_RATE, 2)
+    
+    started = start_transcription(pcm, lang, beam, word_timestamps)
+    if started is None:
+        yield orjson.dumps({"done": True, **no_speech(duration, lang or "unknown", None)}) + b"\n"
+        return
+    segments, language, model_name = started
+    
+    for segment in segments:
+        yield orjson.dumps(segment_item(segment)) + b"\n"
+    
+    yield orjson.dumps({
+        "done": True,
+        "duration": duration,
+        "language": language,
+        "model": model_name
+    }) + b"\n"
 
 
 def verify_auth(authorization: str | None, origin: str | None) -> bool:
@@ -53,25 +836,30 @@ def verify_auth(authorization: str | None, origin: str | None) -> bool:
     3. No auth if API_KEY not configured (backwards compat)
     """
     # If no API key configured, allow all (backwards compat)
-    if not API_KEY:
+    if not _AUTH_ENABLED:
         return True
     
     # Check API key auth
-    if authorization:
-        if authorization.startswith("Bearer "):
-            token = authorization[7:]
-            if token == API_KEY:
-                return True
+    if authorization and authorization[:7] == _BEARER and authorization[7:] == API_KEY:
+        return True
     
     # Allow browser requests from Momentum domains (CORS handles this)
-    if origin and any(allowed in origin for allowed in [
-        "localhost",
-        "dailymomentum.io",
-        "vercel.app"
-    ]):
-        return True
+    return bool(origin) and any(s in origin for s in _ALLOWED_ORIGIN_SUBSTR)
+
+
+@app.on_event("startup")
+def warmup_models():
+    """
+    Run a dummy transcription through every model before serving.
     
-    return False
+    CTranslate2 allocates thread pools and scratch buffers lazily on the
+    first call, and the Silero VAD session is also created on first use.
+    Paying that here keeps it out of the first real request.
+    """
+    print("🔥 Warming up models...")
+    trim_silence(np.zeros(SAMPLE_RATE, dtype=np.float32))
+    BACKEND.warmup()
+    print("✅ Warmup complete!")
 
 
 @app.get("/")
@@ -80,7 +868,7 @@ def root():
     return {
         "service": "Momentum Transcription",
         "status": "healthy",
-        "model": "base",
+        "model": BACKEND.default_model,
         "version": "2.0.0"
     }
 
@@ -88,37 +876,30 @@ def root():
 @app.get("/health")
 def health_check():
     """Detailed health check"""
+    backend = BACKEND.health()
     return {
         "status": "healthy",
-        "model": "base",
+        "backend": BACKEND_NAME,
+        "model": BACKEND.default_model,
         "device": "cpu",
-        "compute_type": "int8",
-        "auth_required": bool(API_KEY)
+        **{k: v for k, v in backend.items() if k not in ("config", "notes")},
+        "auth_required": _AUTH_ENABLED,
+        # Tunables, keyed by the environment variable that sets them
+        "config": {
+            "WEB_CONCURRENCY": WEB_CONCURRENCY,
+            "MAX_CONCURRENCY": MAX_CONCURRENCY,
+            "DEFAULT_LANGUAGE": DEFAULT_LANGUAGE or "auto",
+            "WHISPER_BEAM_SIZE": BEAM_SIZE,
+            "MAX_UPLOAD_MB": MAX_UPLOAD_MB,
+            "CACHE_SIZE": CACHE_SIZE,
+            **backend.get("config", {}),
+        },
+        "notes": backend.get("notes", {}),
     }
 
 
-@app.post("/transcribe")
-async def transcribe_audio(
-    request: Request,
-    audio: UploadFile = File(...),
-    authorization: str | None = Header(None),
-):
-    """
-    Transcribe audio file to text.
-    
-    Accepts: audio/webm, audio/wav, audio/mp3, audio/ogg, audio/mpeg
-    
-    Headers:
-        - Authorization: Bearer <api_key> (required for non-browser requests)
-    
-    Returns:
-        {
-            "text": "Full transcription text",
-            "segments": [{"start": 0.0, "end": 2.5, "text": "..."}],
-            "duration": 10.5,
-            "language": "en"
-        }
-    """
+def check_upload(request: Request, audio: UploadFile, authorization: str | None) -> None:
+    """Authentication and upload checks shared by the transcribe endpoints."""
     # Check authentication
     origin = request.headers.get("origin")
     
@@ -128,7 +909,8 @@ async def transcribe_audio(
             detail="Authentication required. Provide API key via Authorization: Bearer <key>"
         )
     
-    # Validate content type
+    # Validate content type - just a cheap gate for obvious non-audio
+    # uploads; the actual format is sniffed from the bytes when decoding
     content_type = audio.content_type or ""
     if not (content_type.startswith("audio/") or content_type == "application/octet-stream"):
         raise HTTPException(
@@ -136,81 +918,222 @@ async def transcribe_audio(
             detail=f"Invalid content type: {content_type}. Expected audio file."
         )
     
-    # Determine file extension from content type
-    ext_map = {
-        "audio/webm": ".webm",
-        "audio/wav": ".wav",
-        "audio/wave": ".wav",
-        "audio/mp3": ".mp3",
-        "audio/mpeg": ".mp3",
-        "audio/ogg": ".ogg",
-        "audio/flac": ".flac",
-        "application/octet-stream": ".webm",  # Default for unknown
-    }
-    suffix = ext_map.get(content_type, ".webm")
+    # The multipart parser has already spooled the upload (in memory, or on
+    # disk past 1MB), so its size is known without reading it
+    if not audio.size:
+        raise HTTPException(status_code=400, detail="Empty audio file")
+    if audio.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Audio file too large (max {MAX_UPLOAD_MB}MB)"
+        )
+
+
+class TranscribeParams(NamedTuple):
+    """Validated options shared by the transcribe endpoints."""
+    audio: UploadFile
+    lang: str | None
+    beam: int
+    word_timestamps: bool
+
+
+async def transcribe_params(
+    request: Request,
+    audio: UploadFile = File(...),
+    language: str | None = Form(None),
+    beam_size: int | None = Form(None),
+    word_timestamps: bool = Form(False),
+    authorization: str | None = Header(None),
+    x_language: str | None = Header(None),
+) -> TranscribeParams:
+    """
+    Form fields and headers taken by both transcribe endpoints.
     
-    # Save uploaded file to temp location
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        content = await audio.read()
-        if len(content) == 0:
-            raise HTTPException(status_code=400, detail="Empty audio file")
-        tmp.write(content)
-        tmp_path = tmp.name
+    Runs once the multipart body has been parsed, so it also closes the
+    upload stage timer.
+    """
+    UPLOAD_MS.observe(ms_since(request.state.received_at))
+    check_upload(request, audio, authorization)
     
-    try:
-        # Transcribe with faster-whisper
-        segments, info = model.transcribe(
-            tmp_path,
-            beam_size=5,
-            vad_filter=True,  # Filter out silence
-            vad_parameters=dict(min_silence_duration_ms=500)
+    if word_timestamps and not BACKEND.word_timestamps:
+        raise HTTPException(
+            status_code=400,
+            detail=f"word_timestamps is not supported on the {BACKEND_NAME} backend"
         )
-        
-        # Collect results
-        text_parts = []
-        segment_list = []
-        
-        for segment in segments:
-            text_parts.append(segment.text)
-            segment_list.append({
-                "start": round(segment.start, 2),
-                "end": round(segment.end, 2),
-                "text": segment.text.strip()
-            })
-        
-        full_text = " ".join(text_parts).strip()
-        
-        # Handle empty transcription
-        if not full_text:
-            return {
-                "text": "",
-                "segments": [],
-                "duration": info.duration if info else 0,
-                "language": info.language if info else "unknown",
-                "message": "No speech detected in audio"
-            }
-        
-        return {
-            "text": full_text,
-            "segments": segment_list,
-            "duration": round(info.duration, 2) if info else 0,
-            "language": info.language if info else "unknown"
-        }
-        
+    
+    return TranscribeParams(
+        audio=audio,
+        lang=resolve_language(language or x_language),
+        beam=resolve_beam_size(beam_size),
+        word_timestamps=word_timestamps,
+    )
+
+
+@contextmanager
+def transcription_errors() -> Iterator[None]:
+    """Turn unexpected failures into 500s; HTTPExceptions (400, 413) pass through."""
+    try:
+        yield
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Transcription failed: {str(e)}"
         )
-    finally:
-        # Cleanup temp file
-        try:
-            os.unlink(tmp_path)
-        except:
-            pass
+
+
+async def decode_upload(audio: UploadFile, hash_pcm: bool = False) -> tuple[np.ndarray, str | None]:
+    """
+    Decode the upload in the executor, optionally hashing the PCM for the
+    response cache.
+    
+    Hashing runs in the executor too - a 25MB upload can decode to
+    hundreds of MB of PCM, and hashing that on the event loop would stall
+    health checks and CORS preflights.
+    """
+    def decode():
+        t = time.perf_counter()
+        pcm = decode_audio_file(audio.file)
+        PYAV_DECODE_MS.observe(ms_since(t))
+        digest = blake3(pcm.view(np.uint8)).hexdigest() if hash_pcm else None
+        return pcm, digest
+    
+    return await asyncio.get_running_loop().run_in_executor(EXECUTOR, decode)
+
+
+@app.post("/transcribe")
+async def transcribe_audio(params: TranscribeParams = Depends(transcribe_params)):
+    """
+    Transcribe audio file to text.
+    
+    Accepts: any audio format ffmpeg can probe (webm, wav, mp3, ogg, m4a,
+    flac, ...). The format is detected from the file contents.
+    
+    Form fields:
+        - language: Spoken language code, e.g. "en" (optional, "auto" to detect)
+        - beam_size: Beam width (optional, default WHISPER_BEAM_SIZE=1 / greedy)
+        - word_timestamps: Add per-word timings to each segment (optional,
+          default false - costs an extra alignment pass)
+    
+    Headers:
+        - Authorization: Bearer <api_key> (required for non-browser requests)
+        - X-Language: Same as the language form field
+    
+    Setting a language skips Whisper's language-detection pass, which
+    roughly halves latency on short clips.
+    
+    Returns:
+        {
+            "text": "Full transcription text",
+            "segments": [{"start": 0.0, "end": 2.5, "text": "..."}],
+            "duration": 10.5,
+            "language": "en",
+            "model": "base"
+        }
+    
+    Repeat uploads of the same audio with the same options are served
+    from cache and carry "cached": true.
+    """
+    lang, beam, word_timestamps = params.lang, params.beam, params.word_timestamps
+    
+    with transcription_errors():
+        # Bound concurrent work; blocking calls run off the event loop
+        async with SEMAPHORE:
+            # Decode in memory straight from the spooled upload
+            # (hashed for the cache only when it's enabled)
+            pcm, digest = await decode_upload(params.audio, hash_pcm=CACHE_SIZE > 0)
+            
+            # Re-submitted clips (retries, double-taps) are served from cache
+            cache_key = (digest, lang, beam, word_timestamps)
+            if digest is not None:
+                cached = cache_get(cache_key)
+                if cached is not None:
+                    return ORJSONResponse({**cached, "cached": True})
+            
+            result = await asyncio.get_running_loop().run_in_executor(
+                EXECUTOR, transcribe_pcm, pcm, lang, beam, word_timestamps
+            )
+        
+        if digest is not None:
+            cache_put(cache_key, result)
+        # Returned as a response directly so FastAPI doesn't walk every
+        # segment through jsonable_encoder first
+        t = time.perf_counter()
+        response = ORJSONResponse(result)
+        SERIALIZE_MS.observe(ms_since(t))
+        return response
+
+
+@app.post("/transcribe/stream")
+async def transcribe_audio_stream(params: TranscribeParams = Depends(transcribe_params)):
+    """
+    Transcribe audio file to text, streaming segments as they are decoded.
+    
+    Takes the same form fields and headers as /transcribe. Responds with
+    NDJSON (one JSON object per line) so clients see the first segment
+    without waiting for the whole clip:
+    
+        {"start": 0.0, "end": 2.5, "text": "..."}
+        ...
+        {"done": true, "duration": 10.5, "language": "en", "model": "base"}
+    
+    Errors after streaming has started are sent as a final {"error": "..."}
+    line.
+    """
+    lang, beam, word_timestamps = params.lang, params.beam, params.word_timestamps
+    
+    # Decode before returning - the upload is closed once the handler returns
+    with transcription_errors():
+        async with SEMAPHORE:
+            pcm, _ = await decode_upload(params.audio)
+    
+    async def stream_lines():
+        # Whisper runs in the thread pool; lines are handed back to the
+        # event loop through a queue so streaming never blocks it
+        async with SEMAPHORE:
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue[bytes | None] = asyncio.Queue()
+            cancelled = threading.Event()
+            
+            def produce():
+                try:
+                    for line in transcribe_pcm_lines(pcm, lang, beam, word_timestamps):
+                        if cancelled.is_set():
+                            break
+                        loop.call_soon_threadsafe(queue.put_nowait, line)
+                except Exception as e:
+                    error = orjson.dumps({"error": f"Transcription failed: {str(e)}"}) + b"\n"
+                    loop.call_soon_threadsafe(queue.put_nowait, error)
+                finally:
+                    loop.call_soon_threadsafe(queue.put_nowait, None)
+            
+            producer = loop.run_in_executor(EXECUTOR, produce)
+            try:
+                while (line := await queue.get()) is not None:
+                    yield line
+            finally:
+                # Client went away (or we're done) - stop decoding early.
+                # The wait is shielded so a disconnect can't release the
+                # semaphore while the thread is still working
+                cancelled.set()
+                with anyio.CancelScope(shield=True):
+                    await producer
+    
+    return StreamingResponse(stream_lines(), media_type="application/x-ndjson")
 
 
 if __name__ == "__main__":
+    # Single process for local runs. For several workers use the uvicorn CLI
+    # (see Dockerfile) - its supervisor doesn't import this module, so the
+    # models are only loaded inside the workers
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+    )